@@ -4,8 +4,10 @@ This module exports methods for mutual information (MI) estimation
 in the Estimator_mi class.
 """
 from pkg_resources import resource_filename
+import hashlib
 import numpy as np
 import math
+import warnings
 from scipy.special import digamma
 from . import neighbour_search_opencl as nsocl
 from . import idtxl_exceptions as ex
@@ -18,18 +20,123 @@ except ImportError as err:
                             ' from https://pypi.python.org/pypi/JPype1 to use '
                             'JAVA/JIDT-powered CMI estimation.')
 
+try:
+    from numba import njit, prange
+except ImportError:  # optional accelerator only, fall back to numpy
+    njit = None
 
-def is_parallel(estimator_name):
-    """Check if estimator can estimate CMI for multiple chunks in parallel."""
-    parallel_estimators = {'opencl_kraskov': True,
-                           'jidt_kraskov': False,
-                           'jidt_discrete': False,
-                           'jidt_gaussian': False}
+
+_jidt_class_cache = {}
+_jar_path = None
+_jvm_started = False
+
+
+def _ensure_jvm():
+    """Start the JVM with the JIDT jar on the class path, exactly once.
+
+    The jar location is resolved through pkg_resources (a filesystem and
+    metadata lookup) only on first use; the module-level flag short-circuits
+    warm calls before even jpype's isJVMStarted() is consulted.
+    """
+    global _jar_path, _jvm_started
+    if _jvm_started:
+        return
+    if _jar_path is None:
+        _jar_path = resource_filename(__name__, 'infodynamics.jar')
+    if not jp.isJVMStarted():
+        jp.startJVM(jp.getDefaultJVMPath(), '-ea', ('-Djava.class.path=' +
+                    _jar_path))
+    _jvm_started = True
+
+
+def _get_jidt_class(class_name):
+    """Return a JIDT calculator class, starting the JVM if necessary.
+
+    Resolved classes are kept in a module-level cache, so that repeated
+    estimator calls skip the jar lookup and the JPype class resolution, which
+    add up when an estimator is called once per candidate in a network
+    analysis.
+    """
     try:
-        return parallel_estimators[estimator_name]
+        return _jidt_class_cache[class_name]
     except KeyError:
-        print('Unknown estimator name, assuming estimator to be serial.')
+        _ensure_jvm()
+        _jidt_class_cache[class_name] = jp.JClass(class_name)
+        return _jidt_class_cache[class_name]
+
+
+# Max. no. KNN results kept per estimator instance (see opencl_kraskov).
+_KNN_CACHE_SIZE = 8
+
+_EULER_GAMMA = 0.5772156649015329
+
+# Digamma values for integer arguments (see _digamma_int_table).
+_digamma_table = np.array([-np.inf, -_EULER_GAMMA])
+
+
+def _digamma_int_table(max_n):
+    """Return a table of digamma values for integer arguments 0 to max_n.
+
+    For integer n >= 1, psi(n) = -gamma + sum_{k=1}^{n-1} 1/k, so values for
+    all integer arguments can be tabulated with one cumulative sum and then
+    looked up, instead of evaluating the transcendental function per element.
+    The module-level table is grown lazily and reused across chunks, calls,
+    and candidate lags.
+    """
+    global _digamma_table
+    if max_n >= _digamma_table.size:
+        table = np.empty(max_n + 1)
+        table[0] = -np.inf  # digamma diverges at zero
+        table[1] = -_EULER_GAMMA
+        table[2:] = -_EULER_GAMMA + np.cumsum(1.0 / np.arange(1, max_n))
+        _digamma_table = table
+    return _digamma_table
+
+
+def _kraskov_reduce(count_var1, count_var2, digamma_table, psi_const,
+                    n_chunks, chunksize):
+    """Reduce neighbour counts to one Kraskov MI estimate per chunk.
+
+    Compute psi_const - mean(psi(c1 + 1) + psi(c2 + 1)) per chunk of the
+    flat count arrays, where psi_const collects the digamma terms that are
+    constant across realisations and the digamma values for the integer
+    counts are looked up in the precomputed table. If numba is available,
+    this function is replaced by a JIT-compiled version below that fuses
+    both lookups and the chunk-wise mean into a single multithreaded pass.
+    """
+    c1 = digamma_table[count_var1.reshape(n_chunks, chunksize) + 1]
+    c2 = digamma_table[count_var2.reshape(n_chunks, chunksize) + 1]
+    return psi_const - (c1 + c2).mean(axis=1)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _kraskov_reduce(count_var1, count_var2, digamma_table, psi_const,  # noqa: F811
+                        n_chunks, chunksize):
+        mi_array = np.empty(n_chunks)
+        for c in prange(n_chunks):
+            acc = 0.0
+            offset = c * chunksize
+            for i in range(chunksize):
+                acc += (digamma_table[count_var1[offset + i] + 1] +
+                        digamma_table[count_var2[offset + i] + 1])
+            mi_array[c] = psi_const - acc / chunksize
+        return mi_array
+
+
+_PARALLEL_ESTIMATORS = frozenset({'opencl_kraskov'})
+_KNOWN_ESTIMATORS = frozenset({'opencl_kraskov', 'opencl_kraskov_batched',
+                               'jidt_kraskov', 'jidt_discrete',
+                               'jidt_gaussian'})
+
+
+def is_parallel(estimator_name):
+    """Check if estimator can estimate CMI for multiple chunks in parallel."""
+    if estimator_name not in _KNOWN_ESTIMATORS:
+        warnings.warn('Unknown estimator name, assuming estimator to be '
+                      'serial.')
         return False
+    return estimator_name in _PARALLEL_ESTIMATORS
 
 
 def opencl_kraskov(self, var1, var2, n_chunks=1, opts=None):
@@ -62,6 +169,8 @@ def opencl_kraskov(self, var1, var2, n_chunks=1, opts=None):
             - 'theiler_t' - no. next temporal neighbours ignored in KNN and
               range searches (default='ACT', the autocorr. time of the target)
             - 'noise_level' - random noise added to the data (default=1e-8)
+            - 'seed' - seed for the noise generator (default=None, i.e.,
+              noise is non-deterministic)
             - 'gpuid' - ID of the GPU device to be used (default=0)
 
     Returns:
@@ -82,53 +191,155 @@ def opencl_kraskov(self, var1, var2, n_chunks=1, opts=None):
     kraskov_k = int(opts.get('kraskov_k', 4))
     theiler_t = int(opts.get('theiler_t', 0))  # TODO necessary?
     noise_level = np.float32(opts.get('noise_level', 1e-8))
+    seed = opts.get('seed', None)
     gpuid = int(opts.get('gpuid', 0))
     nchunkspergpu = n_chunks
 
-    # Add random noise.
-    var1 += np.random.normal(scale=noise_level, size=var1.shape)
-    var2 += np.random.normal(scale=noise_level, size=var2.shape)
-
-    # build pointsets - Note we assume that pointsets are given in IDTxl conv.
-    # also cast to single precision as required by opencl neighbour search
-    # 1. full space
-    pointset_full_space = np.hstack((var1, var2))
-    pointset_full_space = pointset_full_space.astype('float32')
-    n_dim_full = pointset_full_space.shape[1]
-    var1 = var1.astype('float32')
+    # Build pointset for the full space - Note we assume that pointsets are
+    # given in IDTxl convention. Cast to single precision as required by the
+    # opencl neighbour search and add random noise in float32 as well, so the
+    # data is touched only once and the caller's arrays are left unmodified.
     n_dim_var1 = var1.shape[1]
-    var2 = var2.astype('float32')
     n_dim_var2 = var2.shape[1]
-
-    signallengthpergpu = pointset_full_space.shape[0]
+    n_dim_full = n_dim_var1 + n_dim_var2
+    signallengthpergpu = var1.shape[0]
+    # The float32 staging buffer is kept on the estimator instance and reused
+    # across calls, so back-to-back estimations (e.g., an AIS sweep) do not
+    # re-allocate and fault in a fresh pointset every call. It is only grown,
+    # and released when the estimator is garbage-collected.
+    n_elements = signallengthpergpu * n_dim_full
+    buf = getattr(self, '_pointset_buf', None)
+    if buf is None or buf.size < n_elements:
+        buf = self._pointset_buf = np.empty(n_elements, dtype=np.float32)
+    pointset_full_space = buf[:n_elements].reshape(signallengthpergpu,
+                                                   n_dim_full)
+    # Draw the noise for all dimensions straight into the staging buffer
+    # (standard_normal can only fill contiguous arrays, hence the flat view),
+    # scale it in place and add the data on top -- no noise temporaries. The
+    # generator is kept on the instance and only re-created when a seed is
+    # requested explicitly.
+    rng = getattr(self, '_rng', None)
+    if rng is None or seed is not None:
+        rng = self._rng = np.random.default_rng(seed)
+    rng.standard_normal(dtype=np.float32, out=buf[:n_elements])
+    pointset_full_space *= noise_level
+    pointset_full_space[:, :n_dim_var1] += var1
+    pointset_full_space[:, n_dim_var1:] += var2
 #    print("working with signallength: %i" %signallengthpergpu)
-    chunksize = signallengthpergpu / nchunkspergpu  # TODO check for integer result
-
-    # KNN search in highest dimensional space.
-    indexes, distances = nsocl.knn_search(pointset_full_space, n_dim_full,
-                                          kraskov_k, theiler_t, nchunkspergpu,
-                                          gpuid)
-    radii = distances[distances.shape[0] - 1, :]
+    # Chunks have to divide the data evenly -- the old float division silently
+    # dropped trailing samples and the chunk-wise reduction relies on an exact
+    # reshape of the count arrays.
+    chunksize, remainder = divmod(signallengthpergpu, nchunkspergpu)
+    if remainder:
+        raise ValueError('Signal length {0} is not divisible by the requested'
+                         ' number of chunks ({1}), remainder: {2}.'.format(
+                                 signallengthpergpu, nchunkspergpu, remainder))
+
+    # KNN search in highest dimensional space. Results are cached on the
+    # estimator instance, such that repeated calls with identical inputs
+    # (e.g., candidate sweeps over the same process data) skip the search.
+    # Results can only be reused when the noise draw is reproducible, i.e.,
+    # with an explicit seed or with noise disabled -- otherwise cached radii
+    # would stem from a different noise draw than the pointset used in the
+    # range searches below.
+    indexes = distances = None
+    reuse_knn = seed is not None or noise_level == 0
+    if reuse_knn:
+        digest = hashlib.blake2b()
+        digest.update(var1.tobytes())
+        digest.update(var2.tobytes())
+        cache_key = (signallengthpergpu, n_dim_full, kraskov_k, theiler_t,
+                     nchunkspergpu, float(noise_level), seed, gpuid,
+                     digest.digest())
+        knn_cache = getattr(self, '_knn_cache', None)
+        if knn_cache is None:
+            knn_cache = self._knn_cache = {}
+        try:
+            indexes, distances = knn_cache[cache_key]
+        except KeyError:
+            pass
+    if distances is None:
+        indexes, distances = nsocl.knn_search(pointset_full_space, n_dim_full,
+                                              kraskov_k, theiler_t,
+                                              nchunkspergpu, gpuid)
+        if reuse_knn:
+            if len(knn_cache) >= _KNN_CACHE_SIZE:  # drop the oldest entry
+                del knn_cache[next(iter(knn_cache))]
+            knn_cache[cache_key] = (indexes, distances)
+    # Only the distances to the k-th neighbour are needed past this point.
+    # Copy them out and drop the local references, so the full distance and
+    # index matrices do not stay pinned while the range searches allocate
+    # (cached entries are kept alive by the cache itself until evicted).
+    radii = distances[distances.shape[0] - 1, :].copy()
+    del distances, indexes
 
     # Get neighbour counts in the ranges defined by the k-th nearest
-    # neighbour in the KNN search.
-    count_var1 = nsocl.range_search(var1, n_dim_var1, radii, theiler_t,
+    # neighbour in the KNN search. The marginal spaces are column-slice views
+    # into the joint pointset, no further copies are made here (the neighbour
+    # search fixes the memory layout itself if necessary).
+    count_var1 = nsocl.range_search(pointset_full_space[:, :n_dim_var1],
+                                    n_dim_var1, radii, theiler_t,
                                     nchunkspergpu, gpuid)
-    count_var2 = nsocl.range_search(var2, n_dim_var2, radii, theiler_t,
+    count_var2 = nsocl.range_search(pointset_full_space[:, n_dim_var1:],
+                                    n_dim_var2, radii, theiler_t,
                                     nchunkspergpu, gpuid)
 
-    # Return the results, one mi per chunk of data.
-    mi_array = -np.inf * np.ones(nchunkspergpu).astype('float64')
-    for chunknum in range(0, nchunkspergpu):
-        mi = (digamma(kraskov_k) + digamma(chunksize) -
-              np.mean(digamma(count_var1[chunknum * chunksize:(chunknum + 1) *
-                                         chunksize] + 1) +
-              digamma(count_var2[chunknum * chunksize:(chunknum + 1) *
-                                 chunksize] + 1)))
-        mi_array[chunknum] = mi
+    # Return the results, one mi per chunk of data. The digamma terms for the
+    # integer neighbour counts are looked up in a precomputed table, the mean
+    # over realisations within a chunk is taken by the reduction helper.
+    table = _digamma_int_table(max(int(count_var1.max()),
+                                   int(count_var2.max())) + 1)
+    mi_array = _kraskov_reduce(count_var1, count_var2, table,
+                               digamma(kraskov_k) + digamma(chunksize),
+                               nchunkspergpu, chunksize)
     return mi_array
 
 
+def opencl_kraskov_batched(self, var1_list, var2_list, opts=None):
+    """Estimate MI for a batch of variable pairs in one opencl call.
+
+    Stack multiple (var1, var2) pairs of equal size into a single pointset
+    and estimate their MIs in parallel using the opencl Kraskov estimator,
+    where each pair becomes one 'chunk'. This issues a single KNN search and
+    two range searches on the GPU for the whole batch instead of one set of
+    GPU launches (and host-device transfers) per pair, e.g., when sweeping
+    over candidate lags of a process. The per-pair interface of
+    opencl_kraskov remains unchanged.
+
+    Args:
+        self : instance of Estimator_mi
+            function is supposed to be used as part of the Estimator_mi class
+        var1_list : list of numpy arrays
+            realisations of the first random variable, one array per pair,
+            where all arrays have identical dimensions (realisations x
+            variable dimension)
+        var2_list : list of numpy arrays
+            realisations of the second random variable, one array per pair
+        opts : dict [optional]
+            sets estimation parameters (see opencl_kraskov)
+
+    Returns:
+        numpy array
+            mutual information, one value per pair
+    """
+    assert len(var1_list) == len(var2_list), (
+        'Lists of realisations must have equal length.')
+    n_chunks = len(var1_list)
+    # All pairs have to contribute the same number of realisations, otherwise
+    # the chunk boundaries in the stacked pointset would not coincide with
+    # the pair boundaries and wrong MIs would be returned without an error.
+    n_realisations = var1_list[0].shape[0]
+    for v1, v2 in zip(var1_list, var2_list):
+        assert v1.shape[0] == n_realisations, (
+            'All realisations in var1_list must have equal length.')
+        assert v2.shape[0] == n_realisations, (
+            'Realisations in var2_list must match the length of their '
+            'var1_list counterpart.')
+    var1 = np.vstack(var1_list)
+    var2 = np.vstack(var2_list)
+    return opencl_kraskov(self, var1, var2, n_chunks=n_chunks, opts=opts)
+
+
 def jidt_kraskov(self, var1, var2, opts=None):
     """Calculate mutual information with JIDT's Kraskov implementation.
 
@@ -196,12 +407,8 @@ def jidt_kraskov(self, var1, var2, opts=None):
         var1 = var1[:-lag]
         var2 = var2[lag:]
 
-    jarLocation = resource_filename(__name__, 'infodynamics.jar')
-    if not jp.isJVMStarted():
-        jp.startJVM(jp.getDefaultJVMPath(), '-ea', ('-Djava.class.path=' +
-                    jarLocation))
-    calcClass = (jp.JPackage('infodynamics.measures.continuous.kraskov').
-                 MutualInfoCalculatorMultiVariateKraskov1)
+    calcClass = _get_jidt_class('infodynamics.measures.continuous.kraskov.'
+                                'MutualInfoCalculatorMultiVariateKraskov1')
     calc = calcClass()
     calc.setProperty('NORMALISE', normalise)
     calc.setProperty('k', kraskov_k)
@@ -299,30 +506,33 @@ def jidt_discrete(self, var1, var2, opts=None):
                'requested, but input 1 is not an integer numpy array.')
         assert issubclass(var2.dtype.type, np.integer), ('No discretisation '
                'requested, but input 2 is not an integer numpy array.')
-        assert min(var1) >= 0, 'Minimum of input 1 is smaller than 0.'
-        assert min(var2) >= 0, 'Minimum of input 1 is smaller than 0.'
-        assert max(var1) < num_discrete_bins, (
+        assert var1.min() >= 0, 'Minimum of input 1 is smaller than 0.'
+        assert var2.min() >= 0, 'Minimum of input 2 is smaller than 0.'
+        assert var1.max() < num_discrete_bins, (
                 'Maximum of input 1 is larger than the no. discrete bins - 1.')
-        assert max(var2) < num_discrete_bins, (
+        assert var2.max() < num_discrete_bins, (
                 'Maximum of input 2 is larger than the no. discrete bins - 1.')
 
-    # Then collapse any mulitvariates into univariate arrays:
-    var1 = utils.combine_discrete_dimensions(var1, num_discrete_bins)
-    var2 = utils.combine_discrete_dimensions(var2, num_discrete_bins)
+    # Then collapse any mulitvariates into univariate arrays. Force the
+    # combined arrays to contiguous int32, the element type of the Java int[]
+    # they end up in, so no wider buffers are kept alive host-side and jpype
+    # can transfer them in bulk.
+    var1 = np.ascontiguousarray(
+            utils.combine_discrete_dimensions(var1, num_discrete_bins),
+            dtype=np.int32)
+    var2 = np.ascontiguousarray(
+            utils.combine_discrete_dimensions(var2, num_discrete_bins),
+            dtype=np.int32)
 
     # And finally make the MI calculation:
-    jarLocation = resource_filename(__name__, 'infodynamics.jar')
-    if not jp.isJVMStarted():
-        jp.startJVM(jp.getDefaultJVMPath(), '-ea', ('-Djava.class.path=' +
-                    jarLocation))
-    calcClass = (jp.JPackage('infodynamics.measures.discrete').
-                 MutualInformationCalculatorDiscrete)
+    calcClass = _get_jidt_class('infodynamics.measures.discrete.'
+                                'MutualInformationCalculatorDiscrete')
     calc = calcClass(max_base, lag)
     calc.setDebug(debug)
     calc.initialise()
-    # Unfortunately no faster way to pass numpy arrays in than this list conversion
-    calc.addObservations(jp.JArray(jp.JInt, 1)(var1.tolist()),
-                         jp.JArray(jp.JInt, 1)(var2.tolist()))
+    # Pass the observations through jpype's numpy bridge, which copies the
+    # buffers in bulk instead of boxing every element through a Python list.
+    calc.addObservations(var1, var2)
     return calc.computeAverageLocalOfObservations()
 
 
@@ -371,12 +581,12 @@ def jidt_gaussian(self, var1, var2, opts=None):
     # Get defaults for estimator options
     local_values = opts.get('local_values', False)
 
-    jarLocation = resource_filename(__name__, 'infodynamics.jar')
-    if not jp.isJVMStarted():
-        jp.startJVM(jp.getDefaultJVMPath(), '-ea', ('-Djava.class.path=' +
-                    jarLocation))
-    calcClass = (jp.JPackage('infodynamics.measures.continuous.gaussian').
-                 MutualInfoCalculatorMultiVariateGaussian)
+    # Hand contiguous float64 arrays to jpype, so the conversion to Java
+    # double[][] runs as a bulk copy instead of element-wise conversion.
+    var1 = np.ascontiguousarray(var1, dtype=np.float64)
+    var2 = np.ascontiguousarray(var2, dtype=np.float64)
+    calcClass = _get_jidt_class('infodynamics.measures.continuous.gaussian.'
+                                'MutualInfoCalculatorMultiVariateGaussian')
     calc = calcClass()
     calc.initialise(var1.shape[1], var2.shape[1])
     calc.setObservations(var1, var2)
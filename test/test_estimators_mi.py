@@ -9,6 +9,8 @@ Created on Fri Oct 7 11:29:06 2016
 import pytest
 import random as rn
 import numpy as np
+from scipy.special import digamma
+from idtxl import estimators_mi
 from idtxl.set_estimator import Estimator_mi
 from test_estimators_cmi import jpype_missing
 
@@ -261,7 +263,80 @@ def test_mi_estimator_jidt_gaussian():
                         'MI calculation for Gaussian failed.')
 
 
+def test_is_parallel():
+    """Test lookup of the estimators' parallel capabilities."""
+    assert estimators_mi.is_parallel('opencl_kraskov'), (
+        'opencl_kraskov is not reported as parallel.')
+    assert not estimators_mi.is_parallel('jidt_kraskov'), (
+        'jidt_kraskov is reported as parallel.')
+    with pytest.warns(UserWarning):
+        assert not estimators_mi.is_parallel('no_such_estimator'), (
+            'Unknown estimator is reported as parallel.')
+
+
+def test_opencl_kraskov_chunk_validation():
+    """Test that unevenly divisible chunks raise an error."""
+    var1 = np.random.randn(100, 1)
+    var2 = np.random.randn(100, 1)
+    mi_est = Estimator_mi('opencl_kraskov')
+    with pytest.raises(ValueError):
+        mi_est.estimate(var1=var1, var2=var2, n_chunks=3)
+
+
+def test_opencl_kraskov_batched_input():
+    """Test input checks of the batched opencl estimator."""
+    var_a = np.random.randn(100, 1)
+    var_b = np.random.randn(200, 1)
+    mi_est = Estimator_mi('opencl_kraskov_batched')
+    # Lists of unequal length.
+    with pytest.raises(AssertionError):
+        mi_est.estimate(var1_list=[var_a], var2_list=[var_a, var_a])
+    # Pairs with unequal numbers of realisations.
+    with pytest.raises(AssertionError):
+        mi_est.estimate(var1_list=[var_a, var_b], var2_list=[var_a, var_b])
+    with pytest.raises(AssertionError):
+        mi_est.estimate(var1_list=[var_a, var_a], var2_list=[var_a, var_b])
+
+
+def test_digamma_int_table():
+    """Test tabulated digamma values against scipy's digamma."""
+    table = estimators_mi._digamma_int_table(500)
+    np.testing.assert_allclose(table[1:], digamma(np.arange(1, table.size)))
+    assert np.isneginf(table[0]), 'Table entry for 0 is not -inf.'
+    # Requesting a smaller maximum must not shrink the table.
+    assert estimators_mi._digamma_int_table(10).size == table.size, (
+        'Digamma table was shrunk.')
+
+
+def test_kraskov_reduce():
+    """Test the chunk-wise Kraskov MI reduction against a direct computation."""
+    n_chunks = 4
+    chunksize = 250
+    kraskov_k = 4
+    count_var1 = np.random.randint(
+            1, 50, size=n_chunks * chunksize).astype(np.int32)
+    count_var2 = np.random.randint(
+            1, 50, size=n_chunks * chunksize).astype(np.int32)
+    psi_const = digamma(kraskov_k) + digamma(chunksize)
+    table = estimators_mi._digamma_int_table(51)
+    mi_array = estimators_mi._kraskov_reduce(count_var1, count_var2, table,
+                                             psi_const, n_chunks, chunksize)
+    expected = np.empty(n_chunks)
+    for c in range(n_chunks):
+        idx = slice(c * chunksize, (c + 1) * chunksize)
+        expected[c] = psi_const - np.mean(digamma(count_var1[idx] + 1) +
+                                          digamma(count_var2[idx] + 1))
+    np.testing.assert_allclose(mi_array, expected,
+                               err_msg='Reduced MI does not match the '
+                                       'chunk-wise computation.')
+
+
 if __name__ == '__main__':
+    test_is_parallel()
+    test_opencl_kraskov_chunk_validation()
+    test_opencl_kraskov_batched_input()
+    test_digamma_int_table()
+    test_kraskov_reduce()
     test_mi_corr_gaussian()
     test_lagged_mi_corr_gaussian()
     test_jidt_kraskov_input()